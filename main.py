@@ -5,15 +5,24 @@
 # NOTE: Scraping Amazon may violate their Terms. For production, prefer Amazon Product Advertising API.
 
 import os
+import re
 import time
+import asyncio
+import json
+import signal
+import hashlib
 import logging
+from dataclasses import dataclass
 from datetime import datetime
-from typing import List, Dict, Optional
+from itertools import islice
+from typing import List, Dict, Iterator, Optional, Tuple
 
-import requests
-from bs4 import BeautifulSoup
+import httpx
+from selectolax.lexbor import LexborHTMLParser
+from aiolimiter import AsyncLimiter
 from telegram import Bot
-import schedule
+from telegram.error import RetryAfter
+from telegram.request import HTTPXRequest
 
 # =========================
 # ==== USER SETTINGS ======
@@ -40,6 +49,9 @@ MEGA_MAX = 95.0
 # Check interval in minutes
 CHECK_INTERVAL_MIN = int(os.getenv("CHECK_INTERVAL_MIN", 3))
 
+# Don't re-alert the same product within this many hours unless its price drops
+DEDUP_HOURS = float(os.getenv("DEDUP_HOURS", 6))
+
 # Categories: put your preferred Amazon search/category URLs here (India site shown)
 CATEGORIES: Dict[str, str] = {
     "mobiles": "https://amzn.to/4fJChj3",
@@ -52,11 +64,16 @@ CATEGORIES: Dict[str, str] = {
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
                   "(KHTML, like Gecko) Chrome/117.0 Safari/537.36",
-    "Accept-Language": "en-IN,en;q=0.9"
+    "Accept-Language": "en-IN,en;q=0.9",
+    "Accept-Encoding": "gzip, br"
 }
 
 BASE_DOMAIN = "https://www.amazon.in"
 
+# Where resolved amzn.to short links are cached between restarts, and for how long
+RESOLVED_URLS_FILE = os.getenv("RESOLVED_URLS_FILE", "resolved_categories.json")
+RESOLVED_URLS_TTL_SEC = 3 * 24 * 3600
+
 # =========================
 # ====== LOGGING ==========
 # =========================
@@ -66,38 +83,124 @@ logging.basicConfig(
 )
 
 
+# =========================
+# ====== HTTP CLIENT ======
+# =========================
+# One HTTP/2 client kept across checks; all categories on www.amazon.in share one multiplexed connection
+CLIENT = httpx.AsyncClient(
+    headers=HEADERS,
+    timeout=25.0,
+    follow_redirects=True,
+    transport=httpx.AsyncHTTPTransport(
+        http2=True,
+        retries=2,
+        limits=httpx.Limits(max_connections=4, max_keepalive_connections=4)
+    )
+)
+
+
+_AMAZON_HOST = httpx.URL(BASE_DOMAIN).host
+
+
+async def resolve_category_urls() -> None:
+    """Replace short links in CATEGORIES with their final amazon.in URLs, cached on disk."""
+    try:
+        with open(RESOLVED_URLS_FILE) as f:
+            resolved = json.load(f)
+    except (OSError, ValueError):
+        resolved = {}
+
+    now = time.time()
+    changed = False
+    for name, url in list(CATEGORIES.items()):
+        hit = resolved.get(url)
+        if hit and now - hit["resolved_at"] < RESOLVED_URLS_TTL_SEC:
+            CATEGORIES[name] = hit["url"]
+            continue
+        try:
+            r = await CLIENT.head(url, timeout=10)
+        except Exception as e:
+            logging.warning(f"Could not resolve {name} link, using it as-is: {e}")
+            continue
+        # Error pages and captcha redirects must not be cached as the category URL
+        if not r.is_success or r.url.host != _AMAZON_HOST or r.url.path.startswith("/errors/"):
+            logging.warning(f"Could not resolve {name} link (HTTP {r.status_code}, {r.url}), using it as-is")
+            continue
+        resolved[url] = {"url": str(r.url), "resolved_at": now}
+        CATEGORIES[name] = str(r.url)
+        changed = True
+
+    if changed:
+        try:
+            with open(RESOLVED_URLS_FILE, "w") as f:
+                json.dump(resolved, f, indent=2)
+        except OSError as e:
+            logging.warning(f"Failed to save resolved category links: {e}")
+
+
 # =========================
 # ====== SCRAPING =========
 # =========================
 
+@dataclass(slots=True)
+class Product:
+    """One listing card that passed the price/deal filter."""
+    title: str
+    price: float
+    mrp: Optional[float]
+    link: str  # affiliate-tagged
+    asin: Optional[str] = None
+    high_alert: bool = False
+    discount: Optional[float] = None
+
+
+# Characters dropped from price strings in a single C-level pass
+_PRICE_STRIP = str.maketrans("", "", "₹, \t\n\r\xa0")
+
+
 def normalize_price(text: str) -> Optional[float]:
     """Convert '₹1,234.00' or '1,234' to float."""
     if not text:
         return None
+    t = text.translate(_PRICE_STRIP)
+    if t.count(".") > 1:
+        parts = t.split(".")
+        t = "".join(parts[:-1]) + "." + parts[-1]
     try:
-        t = text.replace("₹", "").replace(",", "").strip()
-        if t.count(".") > 1:
-            parts = t.split(".")
-            t = "".join(parts[:-1]) + "." + parts[-1]
         return float(t)
-    except Exception:
+    except ValueError:
         return None
 
 
+# Selectors and patterns used per card, defined once at import
+_SEL_CARDS = 'div[data-component-type="s-search-result"]'
+# Current price only: the struck-through MRP is also an a-price block, marked a-text-price
+_SEL_OFFSCREEN = "span.a-price:not(.a-text-price) > span.a-offscreen"
+_SEL_WHOLE = "span.a-price-whole"
+_SEL_FRAC = "span.a-price-fraction"
+_SEL_MRP = "span.a-text-price span.a-offscreen"
+_SEL_H2 = "h2"
+_SEL_A = "a"
+_ASIN_RE = re.compile(r"/dp/([A-Z0-9]{10})")
+
+# Canonical affiliate link for a product; one URL per ASIN whatever the listing linked to
+_PRODUCT_URL = f"{BASE_DOMAIN}/dp/{{asin}}?tag={AMAZON_AFFILIATE_TAG}"
+
+
 def parse_price_from_listing(item) -> Optional[float]:
     """Extract current price on search results card."""
-    offscreen = item.find("span", class_="a-offscreen")
-    if offscreen and offscreen.text:
-        p = normalize_price(offscreen.text)
+    offscreen = item.css_first(_SEL_OFFSCREEN)
+    if offscreen:
+        p = normalize_price(offscreen.text())
         if p is not None:
             return p
 
-    whole = item.find("span", class_="a-price-whole")
-    if whole and whole.get_text(strip=True):
-        s = whole.get_text(strip=True).replace(",", "")
-        frac = item.find("span", class_="a-price-fraction")
-        if frac and frac.get_text(strip=True):
-            s += "." + frac.get_text(strip=True)
+    whole = item.css_first(_SEL_WHOLE)
+    if whole and whole.text(strip=True):
+        s = whole.text(strip=True).replace(",", "")
+        frac = item.css_first(_SEL_FRAC)
+        if frac and frac.text(strip=True):
+            s += "." + frac.text(strip=True)
         try:
             return float(s)
         except Exception:
@@ -108,86 +211,166 @@ def parse_price_from_listing(item) -> Optional[float]:
 
 def parse_mrp_from_listing(item) -> Optional[float]:
     """Extract strike-through MRP if present to compute discount."""
-    strike = item.find("span", class_="a-text-price")
-    if strike:
-        off = strike.find("span", class_="a-offscreen")
-        if off and off.text:
-            return normalize_price(off.text)
+    off = item.css_first(_SEL_MRP)
+    if off:
+        return normalize_price(off.text())
     return None
 
 
-def fetch_category_products(category_url: str, max_items: int = 12) -> List[Dict]:
-    """Fetch and parse top products from a category/search page."""
-    products: List[Dict] = []
+# Per-URL validators and parsed products from the last successful fetch
+_PAGE_CACHE: Dict[str, Dict] = {}
+
+
+async def fetch_category_products(category_url: str, max_items: int = 12) -> List[Product]:
+    """Fetch top products from a category/search page, reusing the last parse if unchanged."""
+    cached = _PAGE_CACHE.get(category_url)
+    headers = {}
+    if cached:
+        if cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
+
     try:
-        r = requests.get(category_url, headers=HEADERS, timeout=25)
+        r = await CLIENT.get(category_url, headers=headers)
+        if cached and r.status_code == 304:
+            return cached["products"]
         r.raise_for_status()
     except Exception as e:
         logging.warning(f"Failed to GET category page: {e}")
-        return products
+        return []
+
+    digest = hashlib.blake2b(r.content, digest_size=16).digest()
+    if cached and cached["digest"] == digest:
+        products = cached["products"]
+    else:
+        # Parse off the event loop so other categories keep downloading meanwhile
+        products = await asyncio.to_thread(
+            parse_category_products, r.content, max_items, r.charset_encoding
+        )
+
+    _PAGE_CACHE[category_url] = {
+        "etag": r.headers.get("ETag"),
+        "last_modified": r.headers.get("Last-Modified"),
+        "digest": digest,
+        "products": products
+    }
+    return products
 
-    soup = BeautifulSoup(r.content, "html.parser")
-    cards = soup.find_all("div", {"data-component-type": "s-search-result"})
-    for it in cards:
-        if len(products) >= max_items:
-            break
-        try:
-            h2 = it.find("h2")
-            if not h2 or not h2.a:
-                continue
-            title = h2.get_text(strip=True)
-            href = h2.a.get("href") or ""
-            link = href if href.startswith("http") else (BASE_DOMAIN + href)
 
-            price = parse_price_from_listing(it)
-            if price is None:
-                continue
+def parse_category_products(html: bytes, max_items: int = 12, encoding: Optional[str] = None) -> List[Product]:
+    """Parse a category/search page body into a list of products."""
+    return list(iter_category_products(html, max_items, encoding))
 
-            mrp = parse_mrp_from_listing(it)
 
-            entry = {
-                "title": title,
-                "price": price,
-                "mrp": mrp,
-                "link": link,
-                "high_alert": False
-            }
+def iter_category_products(html: bytes, max_items: int = 12, encoding: Optional[str] = None) -> Iterator[Product]:
+    """Lazily yield top products from a category/search page body.
 
-            if mrp and mrp > 0:
-                discount = (mrp - price) / mrp * 100.0
-                if MEGA_MIN <= discount <= MEGA_MAX:
-                    entry["high_alert"] = True
-                    entry["discount"] = discount
+    `encoding` is the charset from Content-Type. Lexbor reads bytes as UTF-8, so only
+    a different, known declared charset is decoded first; nothing sniffs the body.
+    Cards are parsed one at a time and parsing stops once `max_items` have matched.
+    """
+    if encoding and encoding.lower().replace("-", "") != "utf8":
+        try:
+            html = html.decode(encoding, errors="replace")
+        except LookupError:
+            # Unknown charset name; hand Lexbor the raw bytes as for UTF-8
+            pass
+    tree = LexborHTMLParser(html)
+    products = (parse_card(it) for it in tree.css(_SEL_CARDS))
+    return islice((p for p in products if p is not None), max_items)
 
-            if (MIN_PRICE <= price <= MAX_PRICE) or entry["high_alert"]:
-                products.append(entry)
 
-        except Exception:
-            continue
+def parse_card(it) -> Optional[Product]:
+    """Parse one search result card; None if it is unusable or outside the filter."""
+    try:
+        # Price and the deal filter first; title/link are only read for accepted cards
+        price = parse_price_from_listing(it)
+        if price is None:
+            return None
 
-    return products
+        mrp = parse_mrp_from_listing(it)
+        high_alert = False
+        discount = None
+        if mrp and mrp > 0:
+            discount = (mrp - price) / mrp * 100.0
+            high_alert = MEGA_MIN <= discount <= MEGA_MAX
+
+        if not ((MIN_PRICE <= price <= MAX_PRICE) or high_alert):
+            return None
+
+        h2 = it.css_first(_SEL_H2)
+        a = h2.css_first(_SEL_A) if h2 else None
+        if not a:
+            return None
+        title = h2.text(strip=True)
+        href = a.attributes.get("href") or ""
+        link = href if href.startswith("http") else (BASE_DOMAIN + href)
+        m = _ASIN_RE.search(link)
+        asin = it.attributes.get("data-asin") or (m.group(1) if m else None)
+        if asin:
+            link = _PRODUCT_URL.format(asin=asin)
+        else:
+            link += ("&" if "?" in link else "?") + f"tag={AMAZON_AFFILIATE_TAG}"
+
+        return Product(
+            title=title,
+            price=price,
+            mrp=mrp,
+            link=link,
+            asin=asin,
+            high_alert=high_alert,
+            discount=discount if high_alert else None
+        )
+
+    except Exception:
+        return None
 
 
 # =========================
-# ====== MESSAGING ========
+# ====== DEDUP ============
 # =========================
+# Product key -> (time alerted, price alerted at)
+_SEEN: Dict[str, Tuple[float, float]] = {}
+SEEN_MAX_AGE_SEC = 24 * 3600
 
-def affiliate(url: str) -> str:
-    """Append affiliate tag to URL."""
-    sep = "&" if "?" in url else "?"
-    return f"{url}{sep}tag={AMAZON_AFFILIATE_TAG}"
 
+def product_key(product: Product) -> str:
+    return product.asin or product.link
 
-def build_message(product: Dict, category_name: str) -> str:
-    """Build a human-readable message."""
-    ts = datetime.now().strftime("%d-%b-%Y %H:%M")
-    title = product.get("title", "Product")
-    price = product.get("price")
-    mrp = product.get("mrp")
-    link = affiliate(product.get("link", ""))
 
-    if product.get("high_alert") and mrp:
-        discount = product.get("discount")
+def is_new_alert(product: Product, now: float) -> bool:
+    """True unless the product was alerted recently at the same or a lower price."""
+    seen = _SEEN.get(product_key(product))
+    if not seen:
+        return True
+    seen_at, seen_price = seen
+    return seen_at <= now - DEDUP_HOURS * 3600 or product.price < seen_price
+
+
+def mark_alerted(product: Product, now: float) -> None:
+    _SEEN[product_key(product)] = (now, product.price)
+
+
+def prune_seen(now: float) -> None:
+    cutoff = now - max(SEEN_MAX_AGE_SEC, DEDUP_HOURS * 3600)
+    for key in [k for k, (seen_at, _) in _SEEN.items() if seen_at < cutoff]:
+        del _SEEN[key]
+
+
+# =========================
+# ====== MESSAGING ========
+# =========================
+
+def build_message(product: Product, category_name: str, ts: str) -> str:
+    """Build a human-readable message; `ts` is the check's formatted timestamp."""
+    title = product.title or "Product"
+    price = product.price
+    mrp = product.mrp
+    link = product.link
+
+    if product.high_alert and mrp:
+        discount = product.discount
         lines = [
             "🚨🚨 MEGA DEAL ALERT 🚨🚨",
             f"Category: {category_name}",
@@ -232,42 +415,102 @@ def validate_config() -> bool:
     return ok
 
 
-def run_check(bot: Bot) -> None:
-    sent = 0
-    for name, url in CATEGORIES.items():
-        try:
-            products = fetch_category_products(url, max_items=12)
-            for p in products:
-                msg = build_message(p, name)
-                try:
-                    bot.send_message(chat_id=TELEGRAM_CHAT_ID, text=msg)
-                    sent += 1
-                    time.sleep(0.6)
-                except Exception as e:
-                    logging.warning(f"Telegram send failed: {e}")
-        except Exception as e:
-            logging.warning(f"Error checking {name}: {e}")
-    logging.info(f"Sent {sent} alert(s).")
+# Telegram allows ~30 msg/s per bot overall and ~1 msg/s into a single chat
+_GLOBAL_LIMITER = AsyncLimiter(30, 1)
+_CHAT_LIMITER = AsyncLimiter(1, 1)
 
 
-def main():
+# Monotonic time until which Telegram asked us to stop sending; shared by all sends
+_flood_until = 0.0
+
+
+async def _wait_out_flood() -> None:
+    while (delay := _flood_until - time.monotonic()) > 0:
+        await asyncio.sleep(delay)
+
+
+async def send_alert(bot: Bot, text: str, attempts: int = 3) -> bool:
+    """Send one message within the rate limits, honouring Telegram's RetryAfter."""
+    global _flood_until
+    tries = 0
+    while tries < attempts:
+        await _wait_out_flood()
+        async with _CHAT_LIMITER, _GLOBAL_LIMITER:
+            if _flood_until > time.monotonic():
+                # Another send hit a flood wait while this one was queued
+                continue
+            tries += 1
+            try:
+                await bot.send_message(chat_id=TELEGRAM_CHAT_ID, text=text)
+                return True
+            except RetryAfter as e:
+                _flood_until = max(_flood_until, time.monotonic() + e.retry_after)
+            except Exception as e:
+                logging.warning(f"Telegram send failed: {e}")
+                return False
+    logging.warning("Telegram send failed: still rate limited")
+    return False
+
+
+async def run_check(bot: Bot) -> None:
+    # Fetch every category at once over the shared client
+    fetched = await asyncio.gather(
+        *(fetch_category_products(url, 12) for url in CATEGORIES.values()),
+        return_exceptions=True
+    )
+
+    now = time.time()
+    prune_seen(now)
+    now_str = datetime.now().strftime("%d-%b-%Y %H:%M")
+
+    # Product key -> (product, message); also collapses a product listed in several categories
+    pending: Dict[str, Tuple[Product, str]] = {}
+    for name, products in zip(CATEGORIES, fetched):
+        if isinstance(products, Exception):
+            logging.warning(f"Error checking {name}: {products}")
+            continue
+        for p in products:
+            if is_new_alert(p, now) and product_key(p) not in pending:
+                pending[product_key(p)] = (p, build_message(p, name, now_str))
+
+    results = await asyncio.gather(*(send_alert(bot, msg) for _, msg in pending.values()))
+    for (p, _), ok in zip(pending.values(), results):
+        if ok:
+            mark_alerted(p, now)
+    logging.info(f"Sent {sum(results)} alert(s).")
+
+
+async def main_async():
     if not validate_config():
         return
 
-    bot = Bot(token=TELEGRAM_BOT_TOKEN)
+    bot = Bot(token=TELEGRAM_BOT_TOKEN, request=HTTPXRequest(connection_pool_size=8))
 
+    # Ctrl+C / platform SIGTERM cancel the loop so the bot shuts down cleanly
+    loop = asyncio.get_running_loop()
+    main_task = asyncio.current_task()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, main_task.cancel)
+
+    # Covers startup too (bot initialize, link resolution, startup message), not just the loop
     try:
-        bot.send_message(chat_id=TELEGRAM_CHAT_ID, text="🤖 Bot started. Monitoring categories…")
-    except Exception as e:
-        logging.error(f"Failed to send startup message: {e}")
+        async with CLIENT, bot:
+            await resolve_category_urls()
 
-    run_check(bot)
+            try:
+                await bot.send_message(chat_id=TELEGRAM_CHAT_ID, text="🤖 Bot started. Monitoring categories…")
+            except Exception as e:
+                logging.error(f"Failed to send startup message: {e}")
 
-    schedule.every(CHECK_INTERVAL_MIN).minutes.do(run_check, bot=bot)
+            while True:
+                await run_check(bot)
+                await asyncio.sleep(CHECK_INTERVAL_MIN * 60)
+    except asyncio.CancelledError:
+        logging.info("Shutting down.")
 
-    while True:
-        schedule.run_pending()
-        time.sleep(2)
+
+def main():
+    asyncio.run(main_async())
 
 
 if __name__ == "__main__":